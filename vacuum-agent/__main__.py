@@ -1,14 +1,43 @@
 from time import sleep
+import argparse
+import os
 import sys
 
-from environment import Environment, Dirt, Jewel, Position, VacuumAgent, SCREEN
+from environment import Environment, Dirt, Jewel, Position, VacuumAgent, ALGORITHMS
+from screen import SCREEN
+from interfaces import PlanCache
+from telemetry import Telemetry
+from recorder import TraceRecorder, Trace, apply
 
 from PyQt5.QtWidgets import QApplication, QMainWindow, QGraphicsScene, QGraphicsView, QLabel, QGridLayout
-from PyQt5.QtCore import QThread, QRectF, Qt, QPointF
+from PyQt5.QtCore import QThread, QRectF, Qt, QPointF, QTimer
 from PyQt5.QtGui import QBrush, QPolygonF, QPen
 
 sys.setrecursionlimit(10000)
 
+POLICY_FILE = os.path.join(os.path.dirname(__file__), "policy.npz")  # Built with `python mdp.py policy.npz`
+PLAN_CACHE_FILE = os.path.join(os.path.dirname(__file__), "plans.db")
+# Built with `python pattern_database.py patterns.npy`
+PATTERN_DATABASE_FILE = os.path.join(os.path.dirname(__file__), "patterns.npy")
+
+FRAME_RATE = 30  # Maximum number of GUI refreshes per second
+
+
+def load_policy():
+    """Load the offline policy table if it has been built."""
+    if not os.path.exists(POLICY_FILE):
+        return None
+    from mdp import PolicyTable
+    return PolicyTable.load(POLICY_FILE)
+
+
+def load_pattern_database():
+    """Memory map the pattern database heuristic if it has been generated."""
+    if not os.path.exists(PATTERN_DATABASE_FILE):
+        return None
+    from pattern_database import PatternDatabase
+    return PatternDatabase.load(PATTERN_DATABASE_FILE)
+
 
 class EnvironmentThread(QThread):
 
@@ -20,34 +49,43 @@ class EnvironmentThread(QThread):
         self.environment.run()
 
 
+class ReplayThread(QThread):
+
+    def __init__(self, environment: Environment, trace: Trace, speed: float):
+        QThread.__init__(self)
+        self.environment = environment
+        self.trace = trace
+        self.speed = speed
+
+    def run(self):
+        apply(self.environment, self.trace.events(), self.speed)
+
+
 class AgentThread(QThread):
 
-    def __init__(self, agent, environment):
+    def __init__(self, agent, environment, action_delay: float = 0.2):
         QThread.__init__(self)
         self.environment = environment
         self.agent = agent
+        self.action_delay = action_delay  # Seconds between two actions
 
     def run(self):
-        stored_state = self.environment.map()
-        stored_sequence = None
-        percept_timer = 1
+        feed = self.environment.subscribe()
+        stored_sequence = self.agent(self.environment.percept())  # Copies the environment in the agent memory
 
         while self.agent.alive:
+            if not stored_sequence:
+                feed.wait(1)  # Sleep until something changes
+            events = feed.take()
 
-            percept_timer -= 1
-            current_state = self.environment.map()
-
-            if percept_timer <= 0 and current_state[1::] != stored_state[1::] and len(current_state) > 1:
-                stored_state = current_state
-                stored_sequence = self.agent(self.environment.percept())
+            if any(kind == "spawn" for (version, kind, thing_class, position) in events):
+                stored_sequence = self.agent(events)
+            elif events:
+                self.agent.state = self.agent.update_state(self.agent.state, events)
 
             if stored_sequence:
                 self.environment.execute_action(stored_sequence.pop(0), True)
-
-            if percept_timer <= 0:
-                percept_timer = 5
-
-            sleep(0.2)
+                sleep(self.action_delay)
 
 
 def convert_position(position: Position):
@@ -56,27 +94,39 @@ def convert_position(position: Position):
 
 class Window(QMainWindow):
 
-    def __init__(self, parent=None):
+    def __init__(self, arguments, parent=None):
         super().__init__(parent)
         self.central_widget = self.centralWidget()
         self.scene = QGraphicsScene()
         self.view = QGraphicsView(self.scene)
 
-        self.environment = Environment()
-        self.agent = VacuumAgent()
+        self.trace = Trace(arguments.replay) if arguments.replay else None
+        if self.trace:
+            self.environment = Environment(self.trace.x_max, self.trace.y_max)
+            self.threads = [ReplayThread(self.environment, self.trace, arguments.speed)]
+        else:
+            self.environment = Environment()
+            self.agent = VacuumAgent(load_policy(), PlanCache(path=PLAN_CACHE_FILE), load_pattern_database(),
+                                     arguments.algorithm)
+
+            if arguments.metrics:
+                self.telemetry = Telemetry()
+                self.environment.telemetry = self.agent.telemetry = self.telemetry
+                self.environment.subscribe(self.telemetry)
+                self.telemetry.start_exporter(arguments.metrics)
 
-        self.env_thread = EnvironmentThread(self.environment)
-        self.env_thread.finished.connect(app.exit)
+            self.env_thread = EnvironmentThread(self.environment)
+            self.env_thread.finished.connect(app.exit)
 
-        self.agent_thread = AgentThread(self.agent, self.environment)
+            self.agent_thread = AgentThread(self.agent, self.environment)
+            self.threads = [self.env_thread, self.agent_thread]
 
-        SCREEN.thing_spawn.connect(self.spawn_handler)
-        SCREEN.thing_deleted.connect(self.deleted_thing_handler)
-        SCREEN.thing_moved.connect(self.moved_handler)
-        SCREEN.performance_updated.connect(self.performance_handler)
+        SCREEN.batched = True  # Changes are drawn by render_frame, the screen emits no signal
+        self.environment.screen = SCREEN
 
-        self.dirt_rects = []
-        self.jewel_rects = []
+        self.items = {Dirt: {}, Jewel: {}}  # {thing class: {position tuple: scene item}}
+        self.brushes = {Dirt: QBrush(Qt.gray, Qt.Dense5Pattern), Jewel: QBrush(Qt.cyan, Qt.SolidPattern)}
+        self.agent_pen = QPen(QBrush(Qt.red), 3, Qt.SolidLine)
         self.agent_rect = None
         self.performance_label = None
         self.layout = None
@@ -84,74 +134,72 @@ class Window(QMainWindow):
         self.setup_ui()
         self.view.show()
 
-        self.environment.add_thing(self.agent)
-
-        self.env_thread.start()
-        self.agent_thread.start()
-
-    def moved_handler(self, thing):
-        if isinstance(thing, VacuumAgent):
-            self.draw_agent(thing.position)
-        else:
-            raise NotImplementedError
+        self.frame_timer = QTimer(self)
+        self.frame_timer.timeout.connect(self.render_frame)
+        self.frame_timer.start(1000 // FRAME_RATE)
+
+        if not self.trace:
+            self.environment.add_thing(self.agent)
+            app.aboutToQuit.connect(self.agent.cache.close)
+            if arguments.record:
+                recorder = TraceRecorder(arguments.record, self.environment)
+                recorder.attach(self.agent)
+                app.aboutToQuit.connect(recorder.close)
+
+        for thread in self.threads:
+            thread.start()
+
+    def render_frame(self):
+        """Apply the changes merged by the screen since the last frame."""
+        pending, agent_position, performance = SCREEN.flush()
+        for (thing_class, position), change in pending.items():
+            if change == "spawn":
+                self.draw_thing(thing_class, Position(*position))
+            else:
+                self.remove_thing(thing_class, Position(*position))
+        if agent_position:
+            self.draw_agent(Position(*agent_position))
+        if performance is not None:
+            self.performance_handler(performance)
 
     def performance_handler(self, performance):
         self.performance_label.setText(f'Agent performance : {str(performance)}')
 
-    def spawn_handler(self, thing):
-        if isinstance(thing, Dirt):
-            self.draw_dirt(thing.position)
-        elif isinstance(thing, Jewel):
-            self.draw_jewel(thing.position)
-        elif isinstance(thing, VacuumAgent):
-            self.draw_agent(thing.position)
-
-    def deleted_thing_handler(self, thing):
-        position = convert_position(thing.position)
-        if isinstance(thing, Dirt):
-            for i in range(0, len(self.dirt_rects)):
-                if self.dirt_rects[i].contains(QPointF(position.x, position.y)):
-                    self.scene.removeItem(self.dirt_rects.pop(i))
-                    return
-        elif isinstance(thing, Jewel):
-            for i in range(0, len(self.jewel_rects)):
-                if self.jewel_rects[i].contains(QPointF(position.x, position.y)):
-                    self.scene.removeItem(self.jewel_rects.pop(i))
-                    return
+    def draw_thing(self, thing_class, position: Position):
+        if position.to_tuple() in self.items[thing_class]:
+            return
+        if thing_class is Jewel:
+            self.draw_jewel(position)
+        else:
+            self.draw_dirt(position)
 
-    def draw_jewel(self, position: Position):
-        position = convert_position(position)
-        brush = QBrush()
-        brush.setStyle(Qt.SolidPattern)
-        brush.setColor(Qt.cyan)
+    def remove_thing(self, thing_class, position: Position):
+        item = self.items[thing_class].pop(position.to_tuple(), None)
+        if item:
+            self.scene.removeItem(item)
 
-        self.jewel_rects.append(self.scene.addPolygon(QPolygonF([
-            QPointF(position.x - 10, position.y),
-            QPointF(position.x, position.y - 10),
-            QPointF(position.x + 10, position.y),
-            QPointF(position.x, position.y + 20)
-        ]), brush=brush))
+    def draw_jewel(self, position: Position):
+        center = convert_position(position)
+        self.items[Jewel][position.to_tuple()] = self.scene.addPolygon(QPolygonF([
+            QPointF(center.x - 10, center.y),
+            QPointF(center.x, center.y - 10),
+            QPointF(center.x + 10, center.y),
+            QPointF(center.x, center.y + 20)
+        ]), brush=self.brushes[Jewel])
 
     def draw_dirt(self, position: Position):
-        position = convert_position(position)
-        brush = QBrush()
-        brush.setStyle(Qt.Dense5Pattern)
-        brush.setColor(Qt.gray)
-        self.dirt_rects.append(self.scene.addRect(QRectF(position.x - 50, position.y - 50, 100, 100),
-                                                  brush=brush))
+        center = convert_position(position)
+        self.items[Dirt][position.to_tuple()] = self.scene.addRect(QRectF(center.x - 50, center.y - 50, 100, 100),
+                                                                   brush=self.brushes[Dirt])
 
     def draw_agent(self, position: Position):
         position = convert_position(position)
-        pen = QPen()
-        pen.setStyle(Qt.SolidLine)
-        pen.setWidth(3)
-        pen.setColor(Qt.red)
         if self.agent_rect:
             self.agent_rect.setRect(
                 QRectF(position.x - 40, position.y - 40, 80, 80))
         else:
             self.agent_rect = self.scene.addRect(QRectF(position.x - 40, position.y - 40, 80, 80),
-                                                 pen=pen)
+                                                 pen=self.agent_pen)
 
     def setup_ui(self):
         self.setWindowTitle("Vacuum Agent")
@@ -171,7 +219,15 @@ class Window(QMainWindow):
                 self.scene.addRect(QRectF(100 * x, 100 * y, 100, 100))
 
 
-app = QApplication(sys.argv)
-win = Window()
+parser = argparse.ArgumentParser(description="Vacuum agent simulation.")
+parser.add_argument("--record", help="Record the run in a binary trace")
+parser.add_argument("--metrics", help="Export the metrics every 10 s, Prometheus text or JSON lines if .jsonl")
+parser.add_argument("--replay", help="Replay a binary trace instead of running the agent")
+parser.add_argument("--speed", type=float, default=1, help="Replay speed factor, 0 for full speed")
+parser.add_argument("--algorithm", choices=list(ALGORITHMS), default="astar", help="Online search of the agent")
+arguments, qt_arguments = parser.parse_known_args()
+
+app = QApplication(sys.argv[:1] + qt_arguments)
+win = Window(arguments)
 win.show()
 sys.exit(app.exec())
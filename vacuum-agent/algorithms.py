@@ -2,7 +2,7 @@ import math
 from collections import deque
 from typing import Callable
 
-from interfaces import Node, PriorityQueue, Stack, Problem
+from interfaces import Node, PriorityQueue, Stack, Problem, PlanCache
 
 """
 ------------------------
@@ -11,10 +11,24 @@ ________________________
 """
 
 
-def dfs(problem: Problem) -> Node:
+def cached_solution(problem: Problem, node: Node, cache: PlanCache = None) -> Node:
+    """
+    Complete a node with the cached best actions if its state has already been solved.
+    :param problem: Problem to solve.
+    :param node: Node reached by the search.
+    :param cache: Plan cache, if any.
+    :return: Solution node or None.
+    """
+    if cache is None or cache.lookup(problem, node) is None:
+        return None
+    return cache.complete(problem, node)
+
+
+def dfs(problem: Problem, cache: PlanCache = None) -> Node:
     """
     Depth First Search algorithm.
     :param problem: Problem to solve.
+    :param cache: Plan cache used to end the search on already solved states, dfs gives no cost guarantee anyway.
     :return: Solution node or failed node if no solution is found.
     """
     init_node = Node(problem.initial)
@@ -25,6 +39,9 @@ def dfs(problem: Problem) -> Node:
         current_node = frontier.pop()
         if problem.goal_test(current_node.state):
             return current_node
+        solution = cached_solution(problem, current_node, cache)
+        if solution is not None:
+            return solution
         for child in Node.expand(problem, current_node):
             result_state = child.state
             hashed_state = hash(result_state)
@@ -34,26 +51,37 @@ def dfs(problem: Problem) -> Node:
     return Node("FAILED", cost=math.inf)
 
 
-def breadth_first_search(problem: Problem) -> Node:
+def breadth_first_search(problem: Problem, cache: PlanCache = None) -> Node:
     """
     Breadth First Search algorithm.
     :param problem: Problem to solve.
+    :param cache: Plan cache of this search, a solved initial state is not searched again and the other
+    solutions are upper bounds pruning the search.
     :return: Solution node or failed node if no solution is found.
     """
     node = Node(problem.initial)
     if problem.goal_test(node.state):
         return node
+    solution = cached_solution(problem, node, cache)
+    if solution is not None:
+        return solution  # Already found by the same search
+    best = None  # Cheapest solution completed from the cache
     frontier = deque([node])
     explored = set()
     while frontier:
         node = frontier.popleft()
         explored.add(node.state)
         for child in node.expand(problem, node):
+            if best is not None and child.cost > best.cost:
+                continue  # Can't beat the known solution
             if child.state not in explored and child not in frontier:
                 if problem.goal_test(child.state):
                     return child
+                solution = cached_solution(problem, child, cache)
+                if solution is not None and (best is None or solution.cost < best.cost):
+                    best = solution
                 frontier.append(child)
-    return Node("FAILED", cost=math.inf)
+    return best if best is not None else Node("FAILED", cost=math.inf)
 
 
 """
@@ -63,48 +91,67 @@ ________________________
 """
 
 
-def bfs(problem: Problem, func: Callable) -> Node:
+def bfs(problem: Problem, func: Callable, cache: PlanCache = None, heuristic: Callable = None) -> Node:
     """
     Best First Search algorithm implementation.
     :param problem: Problem to solve.
     :param func: Evaluation function.
+    :param cache: Plan cache of this search, a solved initial state is not searched again and the other
+    solutions are upper bounds pruning the search.
+    :param heuristic: Lower bound of the cost to go used for the pruning, only the cost so far if None.
     :return: Solution node or failed node if no solution is found.
     """
     init_node = Node(problem.initial)
+    best = cached_solution(problem, init_node, cache)
+    if best is not None:
+        return best  # Already found by the same search
+
+    def bound(node: Node) -> float:
+        return node.cost + (heuristic(node) if heuristic else 0)
+
     frontier = PriorityQueue([init_node], key=func)
     searched_nodes = {hash(problem.initial): init_node}  # {hash(state):node}
     while frontier:
         current_node = frontier.pop()[1]
+        if best is not None and bound(current_node) > best.cost:
+            continue  # The frontier is not ordered by cost, the next nodes may still beat the known solution
         if problem.goal_test(current_node.state):
             return current_node
         for child in Node.expand(problem, current_node):
+            if best is not None and bound(child) > best.cost:
+                continue  # Can't beat the known solution
+            solution = cached_solution(problem, child, cache)
+            if solution is not None and (best is None or solution.cost < best.cost):
+                best = solution
             result_state = child.state
             hashed_state = hash(result_state)
             if hashed_state not in searched_nodes or child.cost < searched_nodes[hashed_state].cost:
                 searched_nodes[hashed_state] = child
                 frontier.add(child)
-    return Node("FAILED", cost=math.inf)
+    return best if best is not None else Node("FAILED", cost=math.inf)
 
 
-def greedy_bfs(problem: Problem, heuristic: Callable = None) -> Node:
+def greedy_bfs(problem: Problem, heuristic: Callable = None, cache: PlanCache = None) -> Node:
     """
     Greedy Best First Search algorithm implementation.
     :param problem: Problem to solve.
     :param heuristic: Evaluation function.
+    :param cache: Plan cache.
     :return: Solution node or failed node if no solution is found.
     """
     heuristic = heuristic or problem.heuristic
-    return bfs(problem, heuristic)
+    return bfs(problem, heuristic, cache, heuristic)
 
 
-def astar(problem: Problem, heuristic: Callable = None, cost: Callable = None):
+def astar(problem: Problem, heuristic: Callable = None, cost: Callable = None, cache: PlanCache = None):
     """
     A* algorithm implementation.
     :param problem: Problem to solve.
     :param heuristic:
     :param cost:
+    :param cache: Plan cache.
     :return: Solution node or failed node if no solution is found.
     """
     heuristic = heuristic or problem.heuristic
     cost = cost or problem.cost
-    return bfs(problem, lambda n: heuristic(n) + cost(n))
+    return bfs(problem, lambda n: heuristic(n) + cost(n), cache, heuristic)
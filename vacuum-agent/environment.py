@@ -1,74 +1,124 @@
-from random import random, randint
+from random import Random
 from math import sqrt, pow
-from time import sleep
+from collections import deque
+from threading import Condition, Lock
+from time import sleep, perf_counter
 from typing import Union, List, Tuple
 
 from copy import deepcopy
 
-from PyQt5.QtCore import QObject, pyqtSignal
-
-from interfaces import State, SimpleProblemSolvingAgentProgram, Node, Problem
+from interfaces import State, SimpleProblemSolvingAgentProgram, Node, Problem, PlanCache, RandomSet
 from problem import VacuumProblem, Agent, Thing, Dirt, Jewel, Position
 from algorithms import breadth_first_search, dfs, greedy_bfs, astar
+from hierarchical import HierarchicalPlanner
 
 
-class Screen(QObject):
-    """Make the link between the environment and the GUI."""
-    thing_spawn = pyqtSignal('PyQt_PyObject')
-    thing_deleted = pyqtSignal('PyQt_PyObject')
-    thing_moved = pyqtSignal('PyQt_PyObject')
-    performance_updated = pyqtSignal('PyQt_PyObject')
+class ChangeFeed:
+    """
+    Stream of the changes of an environment, filled by the environment and consumed by a subscriber.
+    An event is a tuple (version, kind, thing class, position tuple) where kind is "spawn", "delete" or "move".
+    """
 
     def __init__(self):
-        QObject.__init__(self)
-
-    def move_thing(self, thing: Thing):
-        """
-        Move thing on the map.
-        :param thing:
-        :return:
-        """
-        self.thing_moved.emit(thing)
+        self.events = deque()
+        self.condition = Condition()
 
-    def spawn_thing(self, thing: Thing):
-        """
-        Create a new thing on the map.
-        :param thing:
-        :return:
-        """
-        self.thing_spawn.emit(thing)
+    def __call__(self, event: Tuple):
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
 
-    def delete_thing(self, thing: Thing):
+    def wait(self, timeout: float = None) -> bool:
         """
-        Delete an existing thing on the map
-        :param thing:
-        :return:
+        Block until an event is available.
+        :param timeout: Maximum time to wait in seconds.
+        :return: True if an event is available.
         """
-        self.thing_deleted.emit(thing)
+        with self.condition:
+            return self.condition.wait_for(lambda: self.events, timeout)
 
-    def update_performance(self, performance: int):
+    def take(self) -> List[Tuple]:
         """
-        Update the performance label.
-        :param performance:
-        :return:
+        Consume the available events.
+        :return: Events, oldest first.
         """
-        self.performance_updated.emit(performance)
-
-
-SCREEN = Screen()
+        with self.condition:
+            events = list(self.events)
+            self.events.clear()
+        return events
 
 
 class Environment(State):
     """Represent the environment with the rooms, dirt and jewels."""
 
-    def __init__(self):
+    def __init__(self, x_max=5, y_max=5, seed=None):
         self.things = []
         self.agent = None
-        self.x_max = 5
-        self.y_max = 5
+        self.x_max = x_max
+        self.y_max = y_max
         self.dirt_probability = 0.05
         self.jewel_probability = 0.02
         self.performance = 10
+        self.rng = Random(seed)
+        rooms = [(x, y) for y in range(y_max) for x in range(x_max)]
+        self.free_rooms = {Dirt: RandomSet(rooms), Jewel: RandomSet(rooms)}  # Rooms where each thing can spawn
+        self.version = 0  # Incremented at each change of the map
+        self.lock = Lock()
+        self.feeds = []
+        self.screen = None  # GUI observer, see screen.py
+        self.telemetry = None  # Metrics collector, see telemetry.py
+        self.recorder = None  # Binary trace, see recorder.py
+
+    def __getstate__(self):
+        # Copies (agent memory, search states) are not observed and never spawn anything
+        state = self.__dict__.copy()
+        for name in ("lock", "feeds", "screen", "telemetry", "recorder", "rng", "free_rooms"):
+            del state[name]
+        if self.agent:
+            state["agent"] = Agent(self.agent.position)  # Not the agent program with its plan cache
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = None  # Created on the first subscription, unobserved copies skip the notifications
+        self.feeds = []
+        self.screen = None
+        self.telemetry = None
+        self.recorder = None
+        self.rng = None
+        self.free_rooms = None
+
+    def subscribe(self, feed: ChangeFeed = None) -> ChangeFeed:
+        """
+        Subscribe to the changes of the environment.
+        :param feed: Feed, or any callable taking an event.
+        :return: The feed.
+        """
+        feed = feed or ChangeFeed()
+        if self.lock is None:
+            self.lock = Lock()
+        self.feeds.append(feed)
+        return feed
+
+    def unsubscribe(self, feed):
+        if feed in self.feeds:
+            self.feeds.remove(feed)
+
+    def notify(self, kind: str, thing: Thing):
+        """
+        Increment the version and send the change to the subscribers, nothing is done on unobserved copies.
+        :param kind: "spawn", "delete" or "move".
+        :param thing: Changed thing.
+        :return:
+        """
+        if self.lock is None:
+            return
+        with self.lock:
+            self.version += 1
+            if self.feeds:
+                event = (self.version, kind, type(thing), thing.position.to_tuple())
+                for feed in self.feeds:
+                    feed(event)
 
     def __eq__(self, other):
         if isinstance(other, Environment):
@@ -81,12 +131,33 @@ class Environment(State):
     def run(self):
         """Run the environment."""
         while True:
-            if random() <= self.dirt_probability:
-                SCREEN.spawn_thing(self.generate_dirt())
-            if random() <= self.jewel_probability:
-                SCREEN.spawn_thing(self.generate_jewel())
+            for thing in self.spawn():
+                if self.screen:
+                    self.screen.spawn_thing(thing)
             sleep(0.2)
 
+    def spawn(self, ticks: int = 1) -> List[Thing]:
+        """
+        Spawn the dirt and jewels of several ticks at once.
+        :param ticks: Number of ticks to simulate.
+        :return: Spawned things.
+        """
+        spawned = []
+        for thing_class, probability in ((Dirt, self.dirt_probability), (Jewel, self.jewel_probability)):
+            count = sum(1 for _ in range(ticks) if self.rng.random() <= probability)
+            spawned += self.generate_batch(thing_class, count)
+        return spawned
+
+    def generate_batch(self, thing_class, count: int) -> List[Thing]:
+        """
+        Generate things in distinct random free rooms.
+        :param thing_class: Dirt or Jewel.
+        :param count: Number of things, less are generated if there are not enough free rooms.
+        :return: Generated things.
+        """
+        return [self.add_thing(thing_class(Position(*room)))
+                for room in self.free_rooms[thing_class].sample(self.rng, count)]
+
     def something_at(self, location: Position, thing_class: List = None) -> Union[list[Thing], bool]:
         """
         Search for Thing or Agent at the given location.
@@ -141,8 +212,10 @@ class Environment(State):
         :return:
         """
         self.performance = performance
-        if update_screen:
-            SCREEN.update_performance(performance)
+        if update_screen and self.screen:
+            self.screen.update_performance(performance)
+        if self.recorder:
+            self.recorder.record_performance(performance)
 
     def execute_action(self, action: str, update_screen=False):
         """
@@ -154,6 +227,7 @@ class Environment(State):
         if not isinstance(action, str):
             raise NotImplementedError
 
+        position = self.agent.position.to_tuple()
         if action == "Left" and self.agent.position.x > 0:
             self.agent.position.x -= 1
             self.set_performance(self.performance - 1, update_screen)
@@ -176,27 +250,29 @@ class Environment(State):
                 self.set_performance(self.performance + 5, update_screen)
             if Jewel in deleted_things:
                 self.set_performance(self.performance - 1, update_screen)
-        if update_screen:
-            SCREEN.move_thing(self.agent)
+        if position != self.agent.position.to_tuple():
+            self.notify("move", self.agent)
+        if update_screen and self.screen:
+            self.screen.move_thing(self.agent)
+        if self.telemetry:
+            self.telemetry.record_action(self.performance)
 
     def random_location(self) -> Position:
         """
         Generate a random position on the map.
         :return: Random position.
         """
-        x = randint(0, self.x_max - 1)
-        y = randint(0, self.y_max - 1)
+        x = self.rng.randint(0, self.x_max - 1)
+        y = self.rng.randint(0, self.y_max - 1)
         return Position(x, y)
 
-    def generate_dirt(self) -> Dirt:
+    def generate_dirt(self) -> Union[Dirt, None]:
         """
         Generate dirt at a random position.
-        :return: Generated dirt.
+        :return: Generated dirt, None if every room is already dirty.
         """
-        position = self.random_location()
-        while self.something_at(position, Dirt):
-            position = self.random_location()
-        return self.add_thing(Dirt(position))
+        things = self.generate_batch(Dirt, 1)
+        return things[0] if things else None
 
     def add_thing(self, thing: Thing):
         """
@@ -207,10 +283,15 @@ class Environment(State):
         if issubclass(type(thing), Agent):
             self.agent = thing
             self.agent.position = self.random_location()
-            SCREEN.spawn_thing(thing)
+            self.notify("spawn", thing)
+            if self.screen:
+                self.screen.spawn_thing(thing)
             return self.agent
         elif isinstance(thing, Thing):
             self.things.append(thing)
+            if self.free_rooms and type(thing) in self.free_rooms:
+                self.free_rooms[type(thing)].remove(thing.position.to_tuple())
+            self.notify("spawn", thing)
             return thing
         raise NotImplementedError
 
@@ -222,9 +303,12 @@ class Environment(State):
         :return:
         """
         if thing_to_delete in self.things:
-            if update_screen:
-                SCREEN.delete_thing(thing_to_delete)
+            if update_screen and self.screen:
+                self.screen.delete_thing(thing_to_delete)
             self.things.remove(thing_to_delete)
+            if self.free_rooms and type(thing_to_delete) in self.free_rooms:
+                self.free_rooms[type(thing_to_delete)].add(thing_to_delete.position.to_tuple())
+            self.notify("delete", thing_to_delete)
 
     def delete_thing_at(self, position, things_class: Thing = Dirt, update_screen=False):
         """
@@ -242,32 +326,73 @@ class Environment(State):
                 self.delete_thing(things[0], update_screen)
                 yield thing_class
 
-    def generate_jewel(self) -> Jewel:
+    def generate_jewel(self) -> Union[Jewel, None]:
         """
         Generate a jewel at a random position.
-        :return: Generated jewel.
+        :return: Generated jewel, None if every room already has a jewel.
         """
-        position = self.random_location()
-        while self.something_at(position, Jewel):
-            position = self.random_location()
-        return self.add_thing(Jewel(position))
+        things = self.generate_batch(Jewel, 1)
+        return things[0] if things else None
+
+
+def external_search(name: str, *args) -> Node:
+    """Run a search of external.py, imported on first use so the core does not load NumPy."""
+    import external
+    return getattr(external, name)(*args)
+
+
+ALGORITHMS = {
+    "astar": lambda problem, heuristic, cache: astar(problem, heuristic, cache=cache),
+    "greedy_bfs": lambda problem, heuristic, cache: greedy_bfs(problem, heuristic, cache),
+    "breadth_first_search": lambda problem, heuristic, cache: breadth_first_search(problem, cache),
+    "dfs": lambda problem, heuristic, cache: dfs(problem, cache),
+    # Frontier and closed set on disk, for state spaces which do not fit in memory
+    "external_breadth_first_search":
+        lambda problem, heuristic, cache: external_search("external_breadth_first_search", problem),
+    "external_astar": lambda problem, heuristic, cache: external_search("external_astar", problem, heuristic),
+}
 
 
 class VacuumAgent(Agent, SimpleProblemSolvingAgentProgram):
 
-    def __init__(self):
+    def __init__(self, policy=None, cache: PlanCache = None, pattern_database=None, algorithm: str = "astar",
+                 jewel_penalty: int = 100, verbose: bool = True):
         Thing.__init__(self)
         SimpleProblemSolvingAgentProgram.__init__(self)
         self.alive = True
+        self.algorithm = algorithm  # Key of ALGORITHMS
+        self.jewel_penalty = jewel_penalty
+        self.verbose = verbose
+        self.policy = policy  # Offline policy table, see mdp.py
+        self.cache = cache if cache is not None else PlanCache()  # Solved states, shared between replans
+        self.pattern_database = pattern_database  # Heuristic, see pattern_database.py
+        self.planner = None  # Hierarchical planner used on large floor plans
+        self.planner_settings = None  # Grid, algorithm and jewel penalty the planner has been built for
+        self.region_size = 5
+        self.telemetry = None  # Metrics collector, see telemetry.py
+        self.recorder = None  # Binary trace, see recorder.py
 
     def update_state(self, state: State, percept) -> State:
         """
         Update the state in the agent memory with what the agent can perceive.
         :param state: State of the environment in the agent memory.
-        :param percept: Percept.
+        :param percept: Percept, the environment itself or a list of events of its change feed.
         :return: New state in the agent memory.
         """
-        return deepcopy(percept)
+        if not isinstance(percept, list):
+            return deepcopy(percept)
+        for (version, kind, thing_class, position) in percept:
+            if version <= state.version:
+                continue  # Already in the copied state
+            present = [t for t in state.things if isinstance(t, thing_class) and t.position.to_tuple() == position]
+            if kind == "move" or issubclass(thing_class, Agent):
+                state.agent.position = Position(*position)
+            elif kind == "spawn" and not present:
+                state.things.append(thing_class(Position(*position)))
+            elif kind == "delete" and present:
+                state.things.remove(present[0])
+            state.version = version
+        return state
 
     def formulate_goal(self, state: State) -> any:
         """
@@ -285,7 +410,7 @@ class VacuumAgent(Agent, SimpleProblemSolvingAgentProgram):
         :param goal: Goal.
         :return: Formulated problem.
         """
-        problem = VacuumProblem(state, goal)
+        problem = VacuumProblem(state, goal, self.jewel_penalty)
         return problem
 
     def search(self, problem: Problem) -> List[str]:
@@ -294,9 +419,67 @@ class VacuumAgent(Agent, SimpleProblemSolvingAgentProgram):
         :param problem: Given problem.
         :return: A sequence of actions.
         """
-        print("Searching for a solution")
-        final_node = astar(problem)
-        seq = Node.action_sequence(final_node)
-        if seq:
+        start = perf_counter()
+        seq = self.plan(problem)
+        if self.telemetry:
+            self.telemetry.record_replan(perf_counter() - start, len(seq))
+        if self.recorder:
+            self.recorder.record_plan(len(seq))
+        return seq
+
+    def plan(self, problem: Problem) -> List[str]:
+        """
+        Plan with the offline policy, completed online when it leaves something on the map.
+        :param problem: Given problem.
+        :return: A sequence of actions.
+        """
+        if self.policy and self.policy.fits(problem.initial):
+            seq = self.policy.plan(problem.initial)
+            if seq is not None:
+                state = deepcopy(problem.initial)
+                for action in seq:
+                    state.execute_action(action)
+                if problem.goal_test(state):
+                    return seq
+                # The abstract state only sees the jewel under the agent, the remaining jewels are planned online
+                return seq + self.plan_online(self.formulate_problem(state, problem.goal))
+        return self.plan_online(problem)
+
+    def plan_online(self, problem: Problem) -> List[str]:
+        """
+        Plan with the selected search, region by region on the grids larger than `region_size`.
+        :param problem: Given problem.
+        :return: A sequence of actions.
+        """
+        state = problem.initial
+        if state.x_max > self.region_size or state.y_max > self.region_size:
+            settings = (state.x_max, state.y_max, self.algorithm, self.jewel_penalty)
+            if not self.planner or self.planner_settings != settings:
+                self.planner = HierarchicalPlanner(state.x_max, state.y_max, self.region_size, self.solve,
+                                                   self.jewel_penalty)
+                self.planner_settings = settings
+            if self.verbose:
+                print(f"Searching for a solution region by region with {self.algorithm}")
+            return self.planner.plan(state)
+        if self.verbose:
+            print("Searching for a solution")
+        seq = Node.action_sequence(self.solve(problem))
+        if seq and self.verbose:
             print("Solution found : %s" % seq)
         return seq
+
+    def solve(self, problem: Problem) -> Node:
+        """
+        Run the selected search with the pattern database heuristic and the plan cache.
+        :param problem: Given problem.
+        :return: Solution node or failed node.
+        """
+        heuristic = None
+        if self.pattern_database and self.pattern_database.fits(problem.initial):
+            heuristic = self.pattern_database.heuristic
+        # The searches are deterministic, a plan is reused as is by the same search only
+        cache = self.cache.tagged(self.algorithm + ("/pattern_database" if heuristic else ""))
+        final_node = ALGORITHMS[self.algorithm](problem, heuristic, cache)
+        if final_node.parent is not None:
+            cache.add(problem, final_node)
+        return final_node
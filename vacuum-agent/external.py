@@ -0,0 +1,285 @@
+import heapq
+import math
+import os
+import tempfile
+from typing import Callable, Iterator
+
+import numpy as np
+
+from interfaces import Node, Problem
+
+"""
+------------------------
+-   EXTERNAL MEMORY    -
+________________________
+
+Searches where the frontier layers and the closed set are files of fixed-width state records (see
+`Problem.encode`) instead of Python objects. Layers are sorted on disk by chunks then merged, so
+duplicates are removed with sequential scans only and the search can go past the size of the RAM.
+"""
+
+CHUNK_RECORDS = 1 << 20  # Records sorted in memory at once
+
+
+class RecordFile:
+    """Append-only file of fixed-width records, read back through a memory map."""
+
+    def __init__(self, path: str, record_size: int):
+        self.path = path
+        self.record_size = record_size
+        self.file = open(path, "wb", buffering=1 << 16)
+
+    def append(self, record: bytes):
+        self.file.write(record)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __len__(self):
+        if not self.file.closed:
+            self.file.flush()
+        return os.path.getsize(self.path) // self.record_size
+
+    def records(self) -> np.ndarray:
+        """
+        Memory map the records.
+        :return: Read only array of records.
+        """
+        self.close()
+        if len(self) == 0:
+            return np.empty(0, dtype=f"V{self.record_size}")
+        return np.memmap(self.path, dtype=f"V{self.record_size}", mode="r")
+
+    def __iter__(self) -> Iterator[bytes]:
+        records = self.records()
+        for start in range(0, len(records), CHUNK_RECORDS):
+            yield from (record.tobytes() for record in records[start:start + CHUNK_RECORDS])
+
+    def delete(self):
+        self.close()
+        os.remove(self.path)
+
+
+class ExternalStorage:
+    """Creates the record files of a search in a (temporary) directory."""
+
+    def __init__(self, record_size: int, directory: str = None):
+        self.record_size = record_size
+        self.temporary = tempfile.TemporaryDirectory(dir=directory)
+        self.counter = 0
+
+    def new(self, name: str = "records") -> RecordFile:
+        self.counter += 1
+        return RecordFile(os.path.join(self.temporary.name, f"{name}-{self.counter}.bin"), self.record_size)
+
+    def sort_unique(self, source: RecordFile) -> RecordFile:
+        """
+        External merge sort removing the duplicates.
+        :param source: Unsorted records, deleted once sorted.
+        :return: Sorted records.
+        """
+        records = source.records()
+        runs = []
+        for start in range(0, len(records), CHUNK_RECORDS):
+            run = self.new("run")
+            run.file.write(np.unique(records[start:start + CHUNK_RECORDS]).tobytes())
+            runs.append(run)
+        del records
+        source.delete()
+        result = self.new("sorted")
+        previous = None
+        for record in heapq.merge(*runs):
+            if record != previous:
+                result.append(record)
+                previous = record
+        for run in runs:
+            run.delete()
+        result.close()
+        return result
+
+    def difference(self, layer: RecordFile, closed: RecordFile) -> RecordFile:
+        """
+        Remove the records of a sorted file from another sorted file.
+        :param layer:
+        :param closed:
+        :return: Sorted records of layer which are not in closed.
+        """
+        result = self.new("layer")
+        closed_records = iter(closed)
+        current = next(closed_records, None)
+        for record in layer:
+            while current is not None and current < record:
+                current = next(closed_records, None)
+            if record != current:
+                result.append(record)
+        result.close()
+        return result
+
+    def union(self, a: RecordFile, b: RecordFile) -> RecordFile:
+        """
+        Merge two sorted files, the first one is deleted.
+        :param a:
+        :param b:
+        :return: Sorted records.
+        """
+        result = self.new("closed")
+        previous = None
+        for record in heapq.merge(a, b):
+            if record != previous:
+                result.append(record)
+                previous = record
+        a.delete()
+        result.close()
+        return result
+
+    def cleanup(self):
+        self.temporary.cleanup()
+
+
+def failed() -> Node:
+    return Node("FAILED", cost=math.inf)
+
+
+def rebuild(problem: Problem, states: list, actions: list) -> Node:
+    """
+    Build the solution node from the sequence of actions found by backtracking.
+    :param problem:
+    :param states:
+    :param actions:
+    :return: Solution node.
+    """
+    node = Node(problem.decode(states[0]))
+    for action in actions:
+        state = problem.result(node.state, action)
+        node = Node(state, node, action, node.cost + problem.cost(node.state, action, state))
+    return node
+
+
+def predecessor(problem: Problem, candidates: RecordFile, target: bytes, accept=lambda state, action, child: True):
+    """
+    Find a record generating the target record, by expanding the candidates again.
+    :param problem:
+    :param candidates:
+    :param target:
+    :param accept: Extra condition on the transition.
+    :return: Record and action, or None.
+    """
+    for record in candidates:
+        state = problem.decode(record)
+        for action in problem.actions(state):
+            child = problem.result(state, action)
+            if problem.encode(child) == target and accept(state, action, child):
+                return record, action
+    return None
+
+
+def external_breadth_first_search(problem: Problem, directory: str = None) -> Node:
+    """
+    Breadth First Search with the layers and the closed set stored on disk.
+    :param problem: Problem to solve, must implement encode and decode.
+    :param directory: Where to create the temporary files.
+    :return: Solution node or failed node if no solution is found.
+    """
+    initial = problem.encode(problem.initial)
+    storage = ExternalStorage(len(initial), directory)
+    try:
+        layer = storage.new("layer")
+        layer.append(initial)
+        layer.close()
+        layers = [layer]
+        closed = storage.new("closed")
+        closed.close()
+        while len(layer):
+            for record in layer:
+                if problem.goal_test(problem.decode(record)):
+                    # Backtrack through the previous layers
+                    records, actions = [record], []
+                    for previous in reversed(layers[:-1]):
+                        record, action = predecessor(problem, previous, record)
+                        records.insert(0, record)
+                        actions.insert(0, action)
+                    return rebuild(problem, records, actions)
+
+            children = storage.new("children")
+            for record in layer:
+                state = problem.decode(record)
+                for action in problem.actions(state):
+                    children.append(problem.encode(problem.result(state, action)))
+            closed = storage.union(closed, layer)
+            children = storage.sort_unique(children)
+            layer = storage.difference(children, closed)
+            children.delete()
+            layers.append(layer)
+        return failed()
+    finally:
+        storage.cleanup()
+
+
+def external_astar(problem: Problem, heuristic: Callable = None, directory: str = None) -> Node:
+    """
+    A* with the open list stored on disk as buckets of records sharing the same cost and heuristic.
+    :param problem: Problem to solve, must implement encode and decode.
+    :param heuristic: Heuristic taking a node, the heuristic of the problem if None.
+    :param directory: Where to create the temporary files.
+    :return: Solution node or failed node if no solution is found.
+    """
+    initial = problem.encode(problem.initial)
+    storage = ExternalStorage(len(initial), directory)
+
+    evaluate = heuristic or problem.heuristic
+
+    def heuristic(state):
+        return evaluate(Node(state))
+
+    try:
+        buckets = {}  # {(g, h): RecordFile}
+        bucket = storage.new("bucket")
+        bucket.append(initial)
+        buckets[(0, heuristic(problem.initial))] = bucket
+        expanded = []  # [(g, sorted RecordFile)]
+        closed = storage.new("closed")
+        closed.close()
+        while buckets:
+            (g, h) = min(buckets, key=lambda key: (key[0] + key[1], key[0]))
+            layer = storage.sort_unique(buckets.pop((g, h)))
+            opened = storage.difference(layer, closed)
+            layer.delete()
+            if not len(opened):
+                opened.delete()
+                continue
+
+            for record in opened:
+                if problem.goal_test(problem.decode(record)):
+                    # Backtrack through the expanded buckets with a lower cost
+                    records, actions, cost = [record], [], g
+                    while cost > 0:
+                        for previous_cost, previous in sorted(expanded, key=lambda e: -e[0]):
+                            if previous_cost >= cost:
+                                continue
+                            step = cost - previous_cost
+                            found = predecessor(problem, previous, record,
+                                                lambda s, a, c: problem.cost(s, a, c) == step)
+                            if found:
+                                record, action = found
+                                records.insert(0, record)
+                                actions.insert(0, action)
+                                cost = previous_cost
+                                break
+                        else:
+                            return failed()
+                    return rebuild(problem, records, actions)
+
+            for record in opened:
+                state = problem.decode(record)
+                for action in problem.actions(state):
+                    child = problem.result(state, action)
+                    key = (g + problem.cost(state, action, child), heuristic(child))
+                    if key not in buckets:
+                        buckets[key] = storage.new("bucket")
+                    buckets[key].append(problem.encode(child))
+            closed = storage.union(closed, opened)
+            expanded.append((g, opened))
+        return failed()
+    finally:
+        storage.cleanup()
@@ -0,0 +1,293 @@
+import heapq
+from collections import deque
+from copy import copy
+from typing import Callable, Dict, List, Tuple
+
+from interfaces import Node
+from problem import VacuumProblem, Agent, Position
+from algorithms import astar
+
+"""
+------------------------
+-  HIERARCHICAL (HPA*)  -
+________________________
+
+The floor plan is split into square regions. Entrances are placed on the borders between two regions
+and the distances between the entrances of a region are computed once. A high level plan chooses the
+order in which the regions are cleaned, then each region is solved on its own (A* by default). Local plans are
+cached so a spawn only invalidates the plan of its region.
+"""
+
+MOVES = {"Left": (-1, 0), "Right": (1, 0), "Up": (0, -1), "Down": (0, 1)}
+
+
+class Region:
+    """A rectangle of rooms."""
+
+    def __init__(self, index: int, x_min: int, y_min: int, x_max: int, y_max: int):
+        self.index = index
+        self.x_min = x_min
+        self.y_min = y_min
+        self.x_max = x_max  # Excluded
+        self.y_max = y_max  # Excluded
+        self.entrances = []
+
+    def __contains__(self, cell: Tuple) -> bool:
+        return self.x_min <= cell[0] < self.x_max and self.y_min <= cell[1] < self.y_max
+
+    def __repr__(self):
+        return f"Region {self.index} ({self.x_min},{self.y_min})-({self.x_max},{self.y_max})"
+
+
+class RegionProblem(VacuumProblem):
+    """Vacuum problem where the agent can't leave the given region."""
+
+    def __init__(self, initial, goal, region: Region, jewel_penalty: int = 100):
+        super().__init__(initial, goal, jewel_penalty)
+        self.region = region
+
+    def actions(self, state) -> List[str]:
+        (x, y) = state.agent.position.to_tuple()
+        return [action for action in super().actions(state)
+                if action not in MOVES or (x + MOVES[action][0], y + MOVES[action][1]) in self.region]
+
+    def signature(self) -> bytes:
+        bounds = (self.region.x_min, self.region.y_min, self.region.x_max, self.region.y_max)
+        return super().signature() + b"".join(bound.to_bytes(2, "big") for bound in bounds)
+
+
+class RegionMap:
+    """Abstract graph of the regions and their entrances."""
+
+    def __init__(self, x_max: int, y_max: int, region_size: int = 5):
+        self.x_max = x_max
+        self.y_max = y_max
+        self.region_size = region_size
+        self.regions = []
+        for y in range(0, y_max, region_size):
+            for x in range(0, x_max, region_size):
+                self.regions.append(Region(len(self.regions), x, y, min(x + region_size, x_max),
+                                           min(y + region_size, y_max)))
+        self.columns = (x_max + region_size - 1) // region_size
+        self.graph = {}  # {entrance: {entrance: cost}}
+        self.entrance_distances = {}  # {entrance: {cell of its region: cost}}
+        self.local_paths = {}  # {(start, goal): actions}, filled lazily
+        self.build_entrances()
+        for region in self.regions:
+            for entrance in region.entrances:
+                self.entrance_distances[entrance] = self.distances(region, entrance)
+                for other in region.entrances:
+                    if other != entrance:
+                        self.graph[entrance][other] = self.entrance_distances[entrance][other]
+
+    def region_of(self, cell: Tuple) -> Region:
+        return self.regions[(cell[1] // self.region_size) * self.columns + cell[0] // self.region_size]
+
+    def add_entrance(self, inside: Tuple, outside: Tuple):
+        for cell in (inside, outside):
+            if cell not in self.graph:
+                self.graph[cell] = {}
+                self.region_of(cell).entrances.append(cell)
+        self.graph[inside][outside] = 1
+        self.graph[outside][inside] = 1
+
+    def build_entrances(self):
+        """Place the entrances on each border, in the middle or at both ends of long borders."""
+        for region in self.regions:
+            if region.x_max < self.x_max:
+                border = [(region.x_max - 1, y) for y in range(region.y_min, region.y_max)]
+                self.add_border(border, (1, 0))
+            if region.y_max < self.y_max:
+                border = [(x, region.y_max - 1) for x in range(region.x_min, region.x_max)]
+                self.add_border(border, (0, 1))
+
+    def add_border(self, border: List[Tuple], direction: Tuple):
+        cells = [border[0], border[-1]] if len(border) >= 6 else [border[len(border) // 2]]
+        for (x, y) in cells:
+            self.add_entrance((x, y), (x + direction[0], y + direction[1]))
+
+    def distances(self, region: Region, start: Tuple) -> Dict[Tuple, int]:
+        """
+        Breadth first search inside a region.
+        :param region:
+        :param start:
+        :return: Distance from start to every cell of the region.
+        """
+        distances = {start: 0}
+        frontier = deque([start])
+        while frontier:
+            (x, y) = frontier.popleft()
+            for (dx, dy) in MOVES.values():
+                cell = (x + dx, y + dy)
+                if cell in region and cell not in distances:
+                    distances[cell] = distances[(x, y)] + 1
+                    frontier.append(cell)
+        return distances
+
+    def local_path(self, start: Tuple, goal: Tuple) -> List[str]:
+        """
+        Moves between two cells of the same region, cached.
+        :param start:
+        :param goal:
+        :return: A sequence of actions.
+        """
+        if (start, goal) not in self.local_paths:
+            region = self.region_of(start)
+            distances = self.distances(region, goal)
+            (x, y), path = start, []
+            while (x, y) != goal:
+                for action, (dx, dy) in MOVES.items():
+                    if distances.get((x + dx, y + dy), -1) == distances[(x, y)] - 1:
+                        path.append(action)
+                        (x, y) = (x + dx, y + dy)
+                        break
+            self.local_paths[(start, goal)] = path
+        return self.local_paths[(start, goal)]
+
+    def abstract_distances(self, start: Tuple) -> Dict[Tuple, int]:
+        """
+        Dijkstra on the abstract graph from a cell to every entrance.
+        :param start:
+        :return: Cost to reach each entrance.
+        """
+        region = self.region_of(start)
+        from_start = self.distances(region, start)
+        frontier = [(from_start[e], e) for e in region.entrances]
+        heapq.heapify(frontier)
+        costs = {}
+        while frontier:
+            cost, cell = heapq.heappop(frontier)
+            if cell in costs:
+                continue
+            costs[cell] = cost
+            for neighbour, step in self.graph[cell].items():
+                if neighbour not in costs:
+                    heapq.heappush(frontier, (cost + step, neighbour))
+        return costs
+
+    def distance(self, costs: Dict[Tuple, int], start: Tuple, goal: Tuple) -> float:
+        """
+        Abstract distance between two cells.
+        :param costs: Result of `abstract_distances` for the start cell.
+        :param start:
+        :param goal:
+        :return:
+        """
+        region = self.region_of(goal)
+        distance = min((costs[e] + self.entrance_distances[e][goal] for e in region.entrances if e in costs),
+                       default=float("inf"))
+        if region is self.region_of(start):
+            distance = min(distance, len(self.local_path(start, goal)))
+        return distance
+
+    def abstract_path(self, start: Tuple, goal: Tuple) -> Tuple[int, List[Tuple]]:
+        """
+        Dijkstra on the abstract graph, the start and goal cells being temporarily linked to their region entrances.
+        :param start:
+        :param goal:
+        :return: Cost and sequence of cells to go through.
+        """
+        start_region, goal_region = self.region_of(start), self.region_of(goal)
+        if start_region is goal_region:
+            return len(self.local_path(start, goal)), [start, goal]
+        from_start = self.distances(start_region, start)
+        to_goal = self.distances(goal_region, goal)
+
+        frontier = [(from_start[e], e, start) for e in start_region.entrances]
+        heapq.heapify(frontier)
+        parents = {}
+        while frontier:
+            cost, cell, parent = heapq.heappop(frontier)
+            if cell in parents:
+                continue
+            parents[cell] = parent
+            if cell == goal:
+                path = []
+                while cell != start:
+                    path.append(cell)
+                    cell = parents[cell]
+                return cost, [start] + path[::-1]
+            neighbours = dict(self.graph.get(cell, {}))
+            if cell in goal_region:
+                neighbours[goal] = to_goal[cell]
+            for neighbour, step in neighbours.items():
+                if neighbour not in parents:
+                    heapq.heappush(frontier, (cost + step, neighbour, cell))
+        raise ValueError(f"No path from {start} to {goal}")
+
+    def path(self, start: Tuple, goal: Tuple) -> List[str]:
+        """
+        Refine the abstract path between two cells into a sequence of moves.
+        :param start:
+        :param goal:
+        :return: A sequence of actions.
+        """
+        actions = []
+        cells = self.abstract_path(start, goal)[1]
+        for a, b in zip(cells, cells[1::]):
+            if self.region_of(a) is self.region_of(b):
+                actions += self.local_path(a, b)
+            else:
+                actions += [action for action, move in MOVES.items() if (a[0] + move[0], a[1] + move[1]) == b]
+        return actions
+
+
+class HierarchicalPlanner:
+    """Plan region by region with caching of the local plans."""
+
+    def __init__(self, x_max: int, y_max: int, region_size: int = 5, search: Callable = None,
+                 jewel_penalty: int = 100):
+        self.map = RegionMap(x_max, y_max, region_size)
+        self.search = search or astar  # Takes a region problem and returns the final node
+        self.jewel_penalty = jewel_penalty
+        self.plans = {}  # {(region, entry, contents): (actions, exit)}
+
+    def local_plan(self, environment, region: Region, entry: Tuple, contents: frozenset) -> Tuple[List[str], Tuple]:
+        """
+        Clean a region with the search of the planner, starting from the given entry cell.
+        :param environment: Environment used as template for the sub problem.
+        :param region:
+        :param entry:
+        :param contents: Things of the region, as in `Environment.map`.
+        :return: Sequence of actions and the cell where the agent ends.
+        """
+        key = (region.index, entry, contents)
+        if key not in self.plans:
+            local = copy(environment)
+            local.things = [thing for thing in environment.things if thing.position.to_tuple() in region]
+            local.agent = Agent(Position(*entry))
+            final_node = self.search(RegionProblem(local, None, region, self.jewel_penalty))
+            actions = Node.action_sequence(final_node)
+            (x, y) = entry
+            for action in actions:
+                (dx, dy) = MOVES.get(action, (0, 0))
+                (x, y) = (x + dx, y + dy)
+            self.plans[key] = (actions, (x, y))
+        return self.plans[key]
+
+    def plan(self, environment) -> List[str]:
+        """
+        Plan the cleaning of the whole environment.
+        :param environment:
+        :return: A sequence of actions.
+        """
+        state_map = environment.map()
+        contents = {}
+        for (cell, kind) in state_map[1::]:
+            contents.setdefault(self.map.region_of(cell).index, set()).add((cell, kind))
+        contents = {index: frozenset(things) for index, things in contents.items()}
+        # Only the plans of the regions where something spawned or was removed are lost
+        self.plans = {key: plan for key, plan in self.plans.items() if contents.get(key[0]) == key[2]}
+
+        position = state_map[0]
+        actions = []
+        while contents:
+            # High level : go to the nearest region which needs to be cleaned
+            costs = self.map.abstract_distances(position)
+            cost, index, entry = min((self.map.distance(costs, position, cell), index, cell)
+                                     for index, things in contents.items() for (cell, kind) in things)
+            region = self.map.regions[index]
+            actions += self.map.path(position, entry)
+            local_actions, position = self.local_plan(environment, region, entry, contents.pop(index))
+            actions += local_actions
+        return actions
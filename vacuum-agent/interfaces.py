@@ -1,5 +1,9 @@
+import dbm
 import heapq
-from typing import List
+import struct
+from collections import OrderedDict
+from copy import copy
+from typing import List, Tuple, Union
 
 """
 ------------------------
@@ -70,6 +74,29 @@ class Problem(object):
         """
         return 0
 
+    def encode(self, state: State) -> bytes:
+        """
+        Compact fixed-width record of a state, used by the external memory searches.
+        :param state:
+        :return:
+        """
+        raise NotImplementedError
+
+    def decode(self, record: bytes) -> State:
+        """
+        Rebuild a state from its record.
+        :param record:
+        :return:
+        """
+        raise NotImplementedError
+
+    def signature(self) -> bytes:
+        """
+        Parameters of the problem a cost depends on (floor plan, cost model), prefix of the plan cache keys.
+        :return:
+        """
+        return b""
+
     def __str__(self):
         return f"{type(self).__name__},{self.initial},{self.goal}"
 
@@ -214,6 +241,45 @@ class PriorityQueue:
         return len(self.elements)
 
 
+class RandomSet:
+    """Set with O(1) insertion, removal and uniform random sampling (list + index, removal by swap)."""
+
+    def __init__(self, elements=()):
+        self.elements = []
+        self.index = {}
+        for e in elements:
+            self.add(e)
+
+    def add(self, element):
+        if element not in self.index:
+            self.index[element] = len(self.elements)
+            self.elements.append(element)
+
+    def remove(self, element):
+        i = self.index.pop(element, None)
+        if i is None:
+            return
+        last = self.elements.pop()
+        if i < len(self.elements):
+            self.elements[i] = last
+            self.index[last] = i
+
+    def sample(self, rng, k: int = 1) -> list:
+        """
+        Pick k distinct elements (less if the set is smaller).
+        :param rng: random.Random instance.
+        :param k:
+        :return:
+        """
+        return rng.sample(self.elements, min(k, len(self.elements)))
+
+    def __contains__(self, element):
+        return element in self.index
+
+    def __len__(self):
+        return len(self.elements)
+
+
 class Stack:
 
     def __init__(self):
@@ -230,3 +296,96 @@ class Stack:
 
     def __str__(self):
         return str(self.stack)
+
+
+class PlanCache:
+    """
+    Bounded LRU cache of the cost-to-go and best action of already solved states, keyed by a tag (the search
+    which found them), `Problem.signature` and `Problem.encode`. The searches are not all optimal, so a
+    cost-to-go is only an upper bound. Entries evicted from memory stay available when an on-disk store is given.
+    """
+
+    def __init__(self, capacity: int = 100000, path: str = None):
+        self.capacity = capacity
+        self.entries = OrderedDict()  # {record: (cost to go, action)}
+        self.store = dbm.open(path, "c") if path else None
+        self.tag = b""
+
+    def tagged(self, tag: str):
+        """
+        View of the cache whose entries are only seen by the views with the same tag.
+        :param tag: E.g. the search algorithm and its heuristic.
+        :return: Cache sharing the entries and the store of this one.
+        """
+        view = copy(self)
+        view.tag = tag.encode() + b"\0"
+        return view
+
+    def key(self, problem: Problem, state: State) -> bytes:
+        return self.tag + problem.signature() + problem.encode(state)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: bytes) -> Union[Tuple[float, str], None]:
+        """
+        Lookup a state record.
+        :param key:
+        :return: Cost to go and best action, or None.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.store is not None and key in self.store:
+            value = self.store[key]
+            entry = (struct.unpack(">d", value[:8])[0], value[8:].decode())
+            self.put(key, entry, persist=False)
+            return entry
+        return None
+
+    def put(self, key: bytes, entry: Tuple[float, str], persist=True):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        if persist and self.store is not None:
+            self.store[key] = struct.pack(">d", entry[0]) + entry[1].encode()
+
+    def lookup(self, problem: Problem, node: Node) -> Union[Tuple[float, str], None]:
+        return self.get(self.key(problem, node.state))
+
+    def add(self, problem: Problem, solution: Node):
+        """
+        Remember the cost-to-go of every node of a solution, the cheapest known cost is kept.
+        :param problem:
+        :param solution:
+        :return:
+        """
+        node = solution
+        while node.parent is not None:
+            key = self.key(problem, node.parent.state)
+            entry = self.get(key)
+            cost_to_go = solution.cost - node.parent.cost
+            if entry is None or cost_to_go < entry[0]:
+                self.put(key, (cost_to_go, node.action))
+            node = node.parent
+
+    def complete(self, problem: Problem, node: Node) -> Union[Node, None]:
+        """
+        Follow the cached best actions from a node up to a goal.
+        :param problem:
+        :param node:
+        :return: Solution node, or None if the cached path is broken.
+        """
+        while not problem.goal_test(node.state):
+            entry = self.lookup(problem, node)
+            if entry is None:
+                return None
+            state = problem.result(node.state, entry[1])
+            node = Node(state, node, entry[1], node.cost + problem.cost(node.state, entry[1], state))
+        return node
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
@@ -0,0 +1,195 @@
+import argparse
+from typing import List, Tuple
+
+import numpy as np
+
+"""
+------------------------
+-   ABSTRACT MDP MODEL  -
+________________________
+
+The real state space (agent position x content of every room) is far too big to be solved offline,
+so the environment is abstracted as (agent cell, target cell, jewel on agent cell) where the target
+is the nearest dirt (Manhattan distance) or NONE when the map is clean. Dirt and jewels spawn after
+each action with the probabilities of the environment, which may change the target.
+Blocked moves are not available and idling (Suck or Grab on an empty room) costs as much as a move,
+otherwise waiting would be worth more than walking to a dirt more than a few rooms away.
+"""
+
+ACTIONS = ["Left", "Right", "Up", "Down", "Suck", "Grab"]
+
+MAX_CELLS = 144  # Above 12x12 the closer-cell mask gets too big, the agent plans online instead.
+
+
+class PolicyTable:
+    """Lookup table giving the best action for every abstract state."""
+
+    def __init__(self, policy: np.ndarray, values: np.ndarray, x_max: int, y_max: int):
+        self.policy = policy  # shape (cells, cells + 1, 2), index in ACTIONS
+        self.values = values
+        self.x_max = x_max
+        self.y_max = y_max
+
+    @property
+    def cells(self) -> int:
+        return self.x_max * self.y_max
+
+    def fits(self, environment) -> bool:
+        """
+        Check if the table has been built for the grid of the given environment.
+        :param environment:
+        :return:
+        """
+        return environment.x_max == self.x_max and environment.y_max == self.y_max
+
+    def cell(self, position: Tuple) -> int:
+        return position[1] * self.x_max + position[0]
+
+    def lookup(self, agent: Tuple, dirt: List[Tuple], jewels) -> str:
+        """
+        Find the action to execute in a given situation.
+        :param agent: Agent position.
+        :param dirt: Dirty rooms positions.
+        :param jewels: Rooms containing a jewel.
+        :return: Action.
+        """
+        target = self.cells
+        distance = None
+        for position in dirt:
+            d = abs(agent[0] - position[0]) + abs(agent[1] - position[1])
+            if distance is None or d < distance:
+                target, distance = self.cell(position), d
+        return ACTIONS[self.policy[self.cell(agent), target, int(agent in jewels)]]
+
+    def plan(self, environment) -> List[str]:
+        """
+        Roll the policy out on the current map (without future spawns) to get a sequence of actions.
+        :param environment:
+        :return: A sequence of actions, None if the rollout does not clean every dirt.
+        """
+        state_map = environment.map()
+        (x, y) = state_map[0]
+        dirt = [t[0] for t in state_map[1::] if t[1] == "Dirt"]
+        jewels = {t[0] for t in state_map[1::] if t[1] == "Jewel"}
+        seq = []
+        for _ in range(4 * self.cells):
+            if not dirt and (x, y) not in jewels:
+                break
+            action = self.lookup((x, y), dirt, jewels)
+            if action == "Left" and x > 0:
+                x -= 1
+            elif action == "Right" and x < self.x_max - 1:
+                x += 1
+            elif action == "Up" and y > 0:
+                y -= 1
+            elif action == "Down" and y < self.y_max - 1:
+                y += 1
+            elif action == "Suck":
+                if (x, y) not in dirt and (x, y) not in jewels:
+                    break
+                if (x, y) in dirt:
+                    dirt.remove((x, y))
+                jewels.discard((x, y))
+            elif action == "Grab":
+                if (x, y) not in jewels:
+                    break
+                jewels.discard((x, y))
+            else:
+                break
+            seq.append(action)
+        return None if dirt else seq
+
+    def save(self, path: str):
+        """
+        Serialise the table to disk.
+        :param path:
+        :return:
+        """
+        np.savez_compressed(path, policy=self.policy, values=self.values, shape=np.array([self.x_max, self.y_max]))
+
+    @staticmethod
+    def load(path: str):
+        """
+        Load a table previously saved with `save`.
+        :param path:
+        :return: The policy table.
+        """
+        with np.load(path) as data:
+            x_max, y_max = data["shape"]
+            return PolicyTable(data["policy"], data["values"], int(x_max), int(y_max))
+
+
+def value_iteration(x_max: int = 5, y_max: int = 5, dirt_probability: float = 0.05, jewel_probability: float = 0.02,
+                    gamma: float = 0.95, epsilon: float = 1e-4, max_iterations: int = 10000) -> PolicyTable:
+    """
+    Solve the abstract MDP with value iteration.
+    :param x_max: Width of the grid.
+    :param y_max: Height of the grid.
+    :param dirt_probability: Probability for a dirt to spawn at each tick.
+    :param jewel_probability: Probability for a jewel to spawn at each tick.
+    :param gamma: Discount factor.
+    :param epsilon: Convergence threshold.
+    :param max_iterations:
+    :return: The policy table.
+    """
+    n = x_max * y_max
+    if n > MAX_CELLS:
+        raise ValueError(f"Grid too large for an offline policy ({n} > {MAX_CELLS} cells)")
+
+    xs, ys = np.arange(n) % x_max, np.arange(n) // x_max
+    cells = np.arange(n)
+    targets = np.arange(n + 1)  # n is the NONE target
+
+    # Cell reached by each move, a blocked move leaves the agent in place and is never chosen
+    moves = np.stack([
+        np.where(xs > 0, cells - 1, cells),
+        np.where(xs < x_max - 1, cells + 1, cells),
+        np.where(ys > 0, cells - x_max, cells),
+        np.where(ys < y_max - 1, cells + x_max, cells),
+    ])
+
+    # closer[a, t, c] is True when a dirt spawning in c becomes the new target of an agent in a
+    distance = np.abs(xs[:, None] - xs[None, :]) + np.abs(ys[:, None] - ys[None, :])
+    target_distance = np.concatenate([distance, np.full((n, 1), np.iinfo(distance.dtype).max)], axis=1)
+    closer = (distance[:, None, :] < target_distance[:, :, None]).astype(float)
+    switch = dirt_probability / n
+    stay = 1 - switch * closer.sum(axis=2)
+    p_jewel = jewel_probability / n
+
+    at_target = (targets[None, :] == cells[:, None]).astype(float)  # (a, t)
+    v = np.zeros((n, n + 1, 2))
+
+    def spawn(values):
+        """Expected value once the dirt spawn is resolved, then the jewel spawn on the agent cell."""
+        w = stay[:, :, None] * values + switch * np.einsum("atc,acj->atj", closer, values[:, :n, :])
+        return (1 - p_jewel) * w[:, :, 0] + p_jewel * w[:, :, 1]
+
+    q = np.zeros((len(ACTIONS), n, n + 1, 2))
+    for _ in range(max_iterations):
+        fresh = spawn(v)
+        for i, move in enumerate(moves):
+            moved = (move != cells)[:, None, None]
+            q[i] = np.where(moved, -1 + gamma * fresh[move][:, :, None], -np.inf)
+        # Suck cleans the target dirt and destroys the jewel, Grab takes the jewel
+        sucked = at_target * fresh[:, n:] + (1 - at_target) * fresh
+        idle = (1 - at_target)[:, :, None] * np.array([1, 0])
+        q[4] = 5 * at_target[:, :, None] - np.array([0, 1]) - idle + gamma * sucked[:, :, None]
+        q[5] = np.array([-1, 10]) + gamma * fresh[:, :, None]
+        new_v = q.max(axis=0)
+        delta = np.abs(new_v - v).max()
+        v = new_v
+        if delta < epsilon:
+            break
+
+    return PolicyTable(q.argmax(axis=0).astype(np.int8), v.astype(np.float32), x_max, y_max)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline policy table of the vacuum agent.")
+    parser.add_argument("output", help="File where to save the table (.npz)")
+    parser.add_argument("--width", type=int, default=5)
+    parser.add_argument("--height", type=int, default=5)
+    parser.add_argument("--dirt-probability", type=float, default=0.05)
+    parser.add_argument("--jewel-probability", type=float, default=0.02)
+    args = parser.parse_args()
+    value_iteration(args.width, args.height, args.dirt_probability, args.jewel_probability).save(args.output)
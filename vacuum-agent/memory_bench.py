@@ -0,0 +1,156 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from typing import Dict
+
+from algorithms import astar, dfs, breadth_first_search
+from environment import Environment, VacuumAgent
+from interfaces import Node
+from problem import VacuumProblem
+
+"""
+------------------------
+-  MEMORY REGRESSIONS  -
+________________________
+
+Memory used by the searches, measured with tracemalloc on seeded instances and compared to stored baselines :
+peak memory of a run, bytes per generated node and number of memory blocks allocated by one call to
+`Node.expand` and `VacuumProblem.result`. Run with --update to store new baselines.
+"""
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "memory_baseline.json")
+
+INSTANCES = [  # (size, dirt, jewels, seed)
+    (3, 2, 1, 0),
+    (4, 2, 1, 1),
+    (5, 3, 0, 2),
+]
+
+ALGORITHMS = {"astar": astar, "dfs": dfs, "breadth_first_search": breadth_first_search}
+
+TOLERANCE = 0.1  # Relative increase accepted before reporting a regression
+
+
+def instance(size: int, dirt: int, jewels: int, seed: int) -> VacuumProblem:
+    environment = Environment(size, size, seed)
+    environment.add_thing(VacuumAgent(verbose=False))
+    for _ in range(dirt):
+        environment.generate_dirt()
+    for _ in range(jewels):
+        environment.generate_jewel()
+    return VacuumProblem(environment, None)
+
+
+def allocated_blocks(function, calls: int = 50) -> float:
+    """
+    Number of memory blocks still allocated after a call, results are kept alive.
+    :param function: Function without argument.
+    :param calls:
+    :return: Blocks per call.
+    """
+    results = []
+    gc.collect()
+    gc.disable()  # A collection during the calls would free older blocks and lower the count
+    try:
+        before = tracemalloc.take_snapshot()
+        for _ in range(calls):
+            results.append(function())
+        after = tracemalloc.take_snapshot()
+    finally:
+        gc.enable()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return blocks / calls
+
+
+def measure(problem: VacuumProblem, algorithm) -> Dict:
+    """
+    Measure one search.
+    :param problem:
+    :param algorithm:
+    :return: Metrics.
+    """
+    generated = 0
+    expand = Node.expand
+
+    def counting_expand(p, node):
+        nonlocal generated
+        for child in expand(p, node):
+            generated += 1
+            yield child
+
+    Node.expand = staticmethod(counting_expand)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        algorithm(problem)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        Node.expand = staticmethod(expand)
+
+    return {"peak_bytes": peak, "generated_nodes": generated, "bytes_per_node": peak / max(generated, 1)}
+
+
+def measure_hot_path(problem: VacuumProblem) -> Dict:
+    node = Node(problem.initial)
+    tracemalloc.start()
+    try:
+        return {
+            "expand_blocks": allocated_blocks(lambda: list(Node.expand(problem, node))),
+            "result_blocks": allocated_blocks(lambda: problem.result(problem.initial, "Suck")),
+        }
+    finally:
+        tracemalloc.stop()
+
+
+def run() -> Dict:
+    results = {}
+    for (size, dirt, jewels, seed) in INSTANCES:
+        key = f"{size}x{size}-{dirt}d{jewels}j-s{seed}"
+        results[f"{key}-hot_path"] = measure_hot_path(instance(size, dirt, jewels, seed))
+        for name, algorithm in ALGORITHMS.items():
+            results[f"{key}-{name}"] = measure(instance(size, dirt, jewels, seed), algorithm)
+    return results
+
+
+def compare(results: Dict, baselines: Dict, tolerance: float = TOLERANCE) -> list:
+    """
+    List the metrics going over their baseline.
+    :param results:
+    :param baselines:
+    :param tolerance:
+    :return: Regression messages.
+    """
+    regressions = []
+    for key, metrics in results.items():
+        for metric, value in metrics.items():
+            baseline = baselines.get(key, {}).get(metric)
+            if baseline is not None and value > baseline * (1 + tolerance):
+                regressions.append(f"{key} {metric}: {value:.1f} > {baseline:.1f}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory regression suite of the searches.")
+    parser.add_argument("--update", action="store_true", help="Store the results as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    results = run()
+    for key, metrics in results.items():
+        print(key, " ".join(f"{metric}={value:.1f}" for metric, value in metrics.items()))
+
+    if args.update or not os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Baselines written to {BASELINE_FILE}")
+    else:
+        with open(BASELINE_FILE) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,121 @@
+import argparse
+from itertools import combinations
+from math import comb
+from typing import List, Tuple
+
+import numpy as np
+
+"""
+------------------------
+-   PATTERN DATABASE   -
+________________________
+
+Exact cost of the abstract problem "agent cell + at most k rooms to clean" for every agent cell and every
+subset of rooms. Each room needs at least one action (Suck or Grab) once reached, so the cost of any subset of
+the rooms to clean is a lower bound of the real cost : the heuristic is admissible.
+The table is saved as a .npy file of shape (y_max, x_max, subsets) and memory mapped read only, so the pages
+are shared between all the processes using it.
+"""
+
+
+def subset_index(cells: Tuple, n: int) -> int:
+    """
+    Index of a sorted subset of cells in the table (combinatorial number system, by subset size).
+    :param cells: Sorted cell indexes.
+    :param n: Number of cells of the grid.
+    :return:
+    """
+    offset = sum(comb(n, size) for size in range(len(cells)))
+    return offset + sum(comb(cell, i + 1) for i, cell in enumerate(cells))
+
+
+def generate(x_max: int = 5, y_max: int = 5, targets: int = 3) -> np.ndarray:
+    """
+    Compute the pattern database with dynamic programming over the subsets.
+    :param x_max: Width of the grid.
+    :param y_max: Height of the grid.
+    :param targets: Maximum number of rooms of a pattern.
+    :return: Costs of shape (y_max, x_max, subsets).
+    """
+    n = x_max * y_max
+    xs, ys = np.arange(n) % x_max, np.arange(n) // x_max
+    distance = np.abs(xs[:, None] - xs[None, :]) + np.abs(ys[:, None] - ys[None, :])
+    costs = np.zeros((n, sum(comb(n, size) for size in range(targets + 1))), dtype=np.uint16)
+    for size in range(1, targets + 1):
+        for cells in combinations(range(n), size):
+            best = None
+            for i, first in enumerate(cells):
+                rest = costs[first, subset_index(cells[:i] + cells[i + 1:], n)]
+                cost = distance[:, first] + 1 + rest
+                best = cost if best is None else np.minimum(best, cost)
+            costs[:, subset_index(cells, n)] = best
+    return costs.reshape((y_max, x_max, -1))
+
+
+class PatternDatabase:
+    """Admissible heuristic backed by a memory mapped pattern database."""
+
+    def __init__(self, costs: np.ndarray, max_subsets: int = 32):
+        self.costs = costs
+        self.y_max, self.x_max, subsets = costs.shape
+        self.max_subsets = max_subsets
+        self.targets = 0
+        while sum(comb(self.cells, size) for size in range(self.targets + 1)) < subsets:
+            self.targets += 1
+
+    @property
+    def cells(self) -> int:
+        return self.x_max * self.y_max
+
+    @staticmethod
+    def load(path: str, max_subsets: int = 32):
+        """
+        Memory map a pattern database saved with `save`.
+        :param path:
+        :param max_subsets: Maximum number of patterns looked up for one state.
+        :return:
+        """
+        return PatternDatabase(np.load(path, mmap_mode="r"), max_subsets)
+
+    def save(self, path: str):
+        np.save(path, np.ascontiguousarray(self.costs))
+
+    def fits(self, environment) -> bool:
+        return environment.x_max == self.x_max and environment.y_max == self.y_max
+
+    def lookup(self, agent: Tuple, rooms: List[Tuple]) -> int:
+        """
+        Lower bound of the cost to clean the given rooms.
+        :param agent: Agent position.
+        :param rooms: Rooms containing something.
+        :return:
+        """
+        cells = sorted({y * self.x_max + x for (x, y) in rooms},
+                       key=lambda c: -abs(c % self.x_max - agent[0]) - abs(c // self.x_max - agent[1]))
+        size = min(self.targets, len(cells))
+        h = 0
+        for i, pattern in enumerate(combinations(cells, size)):
+            if i >= self.max_subsets:
+                break
+            h = max(h, int(self.costs[agent[1], agent[0], subset_index(tuple(sorted(pattern)), self.cells)]))
+        return h
+
+    def heuristic(self, node, action=None) -> int:
+        """
+        Heuristic to give to `astar`.
+        :param node:
+        :param action:
+        :return:
+        """
+        state_map = node.state.map()
+        return self.lookup(state_map[0], [t[0] for t in state_map[1::]])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the pattern database heuristic of the vacuum agent.")
+    parser.add_argument("output", help="File where to save the database (.npy)")
+    parser.add_argument("--width", type=int, default=5)
+    parser.add_argument("--height", type=int, default=5)
+    parser.add_argument("--targets", type=int, default=3, help="Maximum number of rooms of a pattern")
+    args = parser.parse_args()
+    PatternDatabase(generate(args.width, args.height, args.targets)).save(args.output)
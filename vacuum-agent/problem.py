@@ -1,7 +1,7 @@
 from typing import Tuple, List
 
 from interfaces import Problem, State
-from copy import deepcopy
+from copy import copy, deepcopy
 
 
 class Position:
@@ -49,8 +49,9 @@ class Jewel(Thing):
 
 class VacuumProblem(Problem):
 
-    def __init__(self, initial, goal):
+    def __init__(self, initial, goal, jewel_penalty: int = 100):
         super().__init__(initial, goal)
+        self.jewel_penalty = jewel_penalty  # Extra cost of sucking a jewel
 
     def actions(self, state: State) -> List[str]:
         """
@@ -62,11 +63,11 @@ class VacuumProblem(Problem):
         actions = ["Grab", "Suck"]
         if x != 0:
             actions += ["Left"]
-        if x != 4:
+        if x != state.x_max - 1:
             actions += ["Right"]
         if y != 0:
             actions += ["Up"]
-        if y != 4:
+        if y != state.y_max - 1:
             actions += ["Down"]
         return actions
 
@@ -89,6 +90,46 @@ class VacuumProblem(Problem):
         result.execute_action(action)
         return result
 
+    def encode(self, state: State) -> bytes:
+        """
+        Encode a state as the agent position followed by a dirt bit and a jewel bit per room.
+        :param state:
+        :return: Record of 4 + ceil(rooms / 4) bytes.
+        """
+        bits = 0
+        for thing in state.things:
+            room = thing.position.y * state.x_max + thing.position.x
+            bits |= 1 << (2 * room + (0 if isinstance(thing, Dirt) else 1))
+        size = (2 * state.x_max * state.y_max + 7) // 8
+        return (state.agent.position.x.to_bytes(2, "big") + state.agent.position.y.to_bytes(2, "big")
+                + bits.to_bytes(size, "big"))
+
+    def decode(self, record: bytes) -> State:
+        """
+        Rebuild a state from a record, the initial state is used for everything which is not encoded.
+        :param record:
+        :return: State.
+        """
+        state = copy(self.initial)
+        state.agent = Agent(Position(int.from_bytes(record[0:2], "big"), int.from_bytes(record[2:4], "big")))
+        bits = int.from_bytes(record[4:], "big")
+        state.things = []
+        for room in range(state.x_max * state.y_max):
+            position = (room % state.x_max, room // state.x_max)
+            if bits >> (2 * room) & 1:
+                state.things.append(Dirt(Position(*position)))
+            if bits >> (2 * room + 1) & 1:
+                state.things.append(Jewel(Position(*position)))
+        return state
+
+    def signature(self) -> bytes:
+        """
+        Grid size and jewel penalty, a cached cost-to-go is only valid for the same ones.
+        :return:
+        """
+        return (self.initial.x_max.to_bytes(2, "big") + self.initial.y_max.to_bytes(2, "big")
+                + self.jewel_penalty.to_bytes(4, "big", signed=True))
+
     def cost(self, current_state=None, action=None, future_state=None) -> int:
         """
         Compute the cost of an action.
@@ -99,7 +140,7 @@ class VacuumProblem(Problem):
         """
         c = 1
         if action == "Suck" and current_state.something_at(current_state.agent.position, Jewel):
-            c += 100
+            c += self.jewel_penalty
         return c
 
     ''' #Sum of Manhattan Distance
@@ -115,6 +156,8 @@ class VacuumProblem(Problem):
     # Nearest Neighbour
     def heuristic(self, state, action=None):
         state_map = state.state.map()
+        if len(state_map) == 1:
+            return 0  # Goal, the heuristic is a lower bound of the cost to go
         agent = state_map[0]
         nnd = 15
         for t in state_map[1::]:
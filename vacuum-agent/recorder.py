@@ -0,0 +1,195 @@
+import argparse
+import os
+import struct
+import threading
+from time import monotonic, sleep
+from typing import Iterator, List, Tuple
+
+from problem import Agent, Dirt, Jewel, Position
+
+"""
+------------------------
+-   TRACE RECORDING    -
+________________________
+
+Binary log of a run : a header followed by fixed-width records (version, time, kind, thing, x, y, value).
+The recorder is fed by the change feed of the environment, its performance updates and the plans of the agent.
+The replay side memory maps the log with NumPy to rebuild the environment at any version or re-drive a screen.
+"""
+
+MAGIC = b"VACT"
+HEADER = struct.Struct("<4sHHH")  # Magic, format version, x_max, y_max
+RECORD = struct.Struct("<IdBBHHi")  # Version, time, kind, thing, x, y, value
+
+SPAWN, DELETE, MOVE, PLAN, PERFORMANCE = range(5)
+KINDS = {"spawn": SPAWN, "delete": DELETE, "move": MOVE}
+THINGS = [Agent, Dirt, Jewel]
+
+
+def thing_code(thing_class) -> int:
+    for code, base in enumerate(THINGS):
+        if issubclass(thing_class, base):
+            return code
+    raise NotImplementedError
+
+
+class TraceRecorder:
+    """Append the events of an environment to a binary log."""
+
+    def __init__(self, path: str, environment, buffer_size: int = 1 << 16, flush_interval: float = 1):
+        self.environment = environment
+        self.lock = threading.Lock()
+        self.start = monotonic()
+        self.flush_interval = flush_interval  # Seconds of events which may be lost on a crash
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.file.write(HEADER.pack(MAGIC, 1, environment.x_max, environment.y_max))
+        self.flusher = threading.Thread(target=self.flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def attach(self, agent=None):
+        """
+        Record the given environment (and agent) from now on.
+        :param agent:
+        :return:
+        """
+        self.environment.recorder = self
+        self.environment.subscribe(self)
+        if agent is not None:
+            agent.recorder = self
+        if self.environment.agent:
+            self.record(SPAWN, 0, self.environment.agent.position.to_tuple())
+        for thing in self.environment.things:
+            self.record(SPAWN, thing_code(type(thing)), thing.position.to_tuple())
+        self.record_performance(self.environment.performance)
+
+    def record(self, kind: int, thing: int = 0, position: Tuple = (0, 0), value: int = 0, version: int = None):
+        version = self.environment.version if version is None else version
+        now = monotonic()
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(RECORD.pack(version, now - self.start, kind, thing, position[0], position[1], value))
+
+    def flush_periodically(self):
+        """Flush the buffer from a daemon thread, until the recorder is closed."""
+        while True:
+            sleep(self.flush_interval)
+            with self.lock:
+                if self.file.closed:
+                    return
+                self.file.flush()
+
+    def __call__(self, event: Tuple):
+        """Change feed subscriber."""
+        (version, kind, thing_class, position) = event
+        self.record(KINDS[kind], thing_code(thing_class), position, version=version)
+
+    def record_plan(self, plan_length: int):
+        self.record(PLAN, value=plan_length)
+
+    def record_performance(self, performance: int):
+        self.record(PERFORMANCE, value=performance)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class Trace:
+    """Memory mapped binary log."""
+
+    def __init__(self, path: str):
+        import numpy as np
+        with open(path, "rb") as file:
+            magic, version, self.x_max, self.y_max = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a trace")
+        dtype = np.dtype([("version", "<u4"), ("time", "<f8"), ("kind", "u1"), ("thing", "u1"),
+                          ("x", "<u2"), ("y", "<u2"), ("value", "<i4")])
+        count = (os.path.getsize(path) - HEADER.size) // dtype.itemsize  # A record may be half written
+        if count:
+            self.records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def events(self, until_version: int = None) -> Iterator:
+        """
+        Records up to a given version of the environment.
+        :param until_version: Last version included, everything if None.
+        :return:
+        """
+        records = self.records
+        if until_version is not None:
+            records = records[records["version"] <= until_version]
+        return iter(records)
+
+    def spawns(self) -> List[Tuple]:
+        """
+        Recorded spawn sequence, to run other planners on the same dirt and jewels.
+        :return: List of (time, thing class, position tuple).
+        """
+        records = self.records[(self.records["kind"] == SPAWN) & (self.records["thing"] != 0)]
+        return [(float(r["time"]), THINGS[r["thing"]], (int(r["x"]), int(r["y"]))) for r in records]
+
+    def environment_at(self, version: int = None):
+        """
+        Rebuild the environment as it was at a given version.
+        :param version: Version of the environment, the end of the run if None.
+        :return: Environment.
+        """
+        from environment import Environment
+        environment = Environment(self.x_max, self.y_max)
+        apply(environment, self.events(version))
+        return environment
+
+
+def apply(environment, records, speed: float = None):
+    """
+    Apply records to an environment, the screen attached to the environment is updated.
+    :param environment:
+    :param records:
+    :param speed: Replay speed factor compared to the recording, full speed if None.
+    :return:
+    """
+    start = monotonic()
+    for record in records:
+        if speed:
+            delay = float(record["time"]) / speed - (monotonic() - start)
+            if delay > 0:
+                sleep(delay)
+        kind, thing_class = int(record["kind"]), THINGS[record["thing"]]
+        position = Position(int(record["x"]), int(record["y"]))
+        if kind == SPAWN and thing_class is Agent:
+            if environment.agent is None:
+                environment.agent = Agent(position)
+            environment.agent.position = position
+            if environment.screen:
+                environment.screen.spawn_thing(environment.agent)
+        elif kind == SPAWN:
+            thing = environment.add_thing(thing_class(position))
+            if environment.screen:
+                environment.screen.spawn_thing(thing)
+        elif kind == DELETE:
+            things = environment.something_at(position, thing_class)
+            if things:
+                environment.delete_thing(things[0], True)
+        elif kind == MOVE:
+            environment.agent.position = position
+            if environment.screen:
+                environment.screen.move_thing(environment.agent)
+        elif kind == PERFORMANCE:
+            environment.set_performance(int(record["value"]), True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect a trace of the vacuum agent.")
+    parser.add_argument("trace", help="Trace file")
+    parser.add_argument("--version", type=int, default=None, help="Version of the environment to rebuild")
+    args = parser.parse_args()
+    trace = Trace(args.trace)
+    rebuilt = trace.environment_at(args.version)
+    print(f"{len(trace)} records, grid {trace.x_max}x{trace.y_max}")
+    print(f"Map : {rebuilt.map()}")
+    print(f"Performance : {rebuilt.performance}")
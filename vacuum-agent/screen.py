@@ -0,0 +1,93 @@
+from threading import Lock
+from typing import Dict, Tuple, Union
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from problem import Agent, Thing
+
+"""
+GUI binding of the environment, only imported by the window so the simulation core does not depend on Qt.
+Attach it with `environment.screen = SCREEN`.
+"""
+
+
+class Screen(QObject):
+    """
+    Make the link between the environment and the GUI.
+    In batched mode nothing is emitted, the changes are merged until the GUI flushes them once per frame.
+    """
+    thing_spawn = pyqtSignal('PyQt_PyObject')
+    thing_deleted = pyqtSignal('PyQt_PyObject')
+    thing_moved = pyqtSignal('PyQt_PyObject')
+    performance_updated = pyqtSignal('PyQt_PyObject')
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.batched = False
+        self.lock = Lock()
+        self.pending = {}  # {(thing class, position tuple): "spawn" or "delete"}, the last change wins
+        self.agent_position = None
+        self.performance = None
+
+    def move_thing(self, thing: Thing):
+        """
+        Move thing on the map.
+        :param thing:
+        :return:
+        """
+        if self.batched:
+            with self.lock:
+                self.agent_position = thing.position.to_tuple()
+        else:
+            self.thing_moved.emit(thing)
+
+    def spawn_thing(self, thing: Thing):
+        """
+        Create a new thing on the map.
+        :param thing:
+        :return:
+        """
+        if not self.batched:
+            self.thing_spawn.emit(thing)
+        elif isinstance(thing, Agent):
+            self.move_thing(thing)
+        else:
+            with self.lock:
+                self.pending[(type(thing), thing.position.to_tuple())] = "spawn"
+
+    def delete_thing(self, thing: Thing):
+        """
+        Delete an existing thing on the map
+        :param thing:
+        :return:
+        """
+        if self.batched:
+            with self.lock:
+                self.pending[(type(thing), thing.position.to_tuple())] = "delete"
+        else:
+            self.thing_deleted.emit(thing)
+
+    def update_performance(self, performance: int):
+        """
+        Update the performance label.
+        :param performance:
+        :return:
+        """
+        if self.batched:
+            with self.lock:
+                self.performance = performance
+        else:
+            self.performance_updated.emit(performance)
+
+    def flush(self) -> Tuple[Dict, Union[Tuple, None], Union[int, None]]:
+        """
+        Take the changes merged since the last flush.
+        :return: Pending spawns and deletions, agent position and performance.
+        """
+        with self.lock:
+            batch = (self.pending, self.agent_position, self.performance)
+            self.pending, self.agent_position, self.performance = {}, None, None
+        return batch
+
+
+SCREEN = Screen()
@@ -0,0 +1,191 @@
+import argparse
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from random import Random
+from statistics import mean
+from time import process_time
+from typing import Dict, List, Tuple
+
+from environment import Environment, VacuumAgent, ALGORITHMS
+from problem import Dirt, Position
+
+"""
+------------------------
+-   PARAMETER SWEEP    -
+________________________
+
+Headless seeded simulations run in parallel worker processes to tune the agent. One tick of the simulation is
+one tick of `Environment.run`, the agent executes `actions_per_tick` actions per tick (the ratio between the
+environment and agent sleeps of the GUI) and perceives every `percept_interval` ticks.
+The spawns are random, or replayed from a trace (see recorder.py) so every planner faces the same sequence.
+"""
+
+GRID = {
+    "dirt_probability": [0.02, 0.05, 0.1],
+    "jewel_probability": [0.01, 0.02, 0.05],
+    "jewel_penalty": [10, 100],
+    "algorithm": ["astar", "greedy_bfs"],
+    "percept_interval": [1, 5],
+    "actions_per_tick": [1],
+}
+
+METRICS = ["cleanliness", "performance", "cpu_per_decision", "decisions"]
+
+TICK = 0.2  # Seconds between two spawns of `Environment.run`, to convert the times of a trace to ticks
+
+
+def simulate(parameters: Dict, seed: int, ticks: int = 500, size: int = 5, spawns: List[Tuple] = None) -> Dict:
+    """
+    Run one headless simulation.
+    :param parameters: One point of the parameter space, see GRID.
+    :param seed: Seed of the environment.
+    :param ticks: Length of the simulation.
+    :param size: Width and height of the grid.
+    :param spawns: Recorded spawns replayed instead of the random ones, see `recorder.Trace.spawns`.
+    :return: Metrics of the run.
+    """
+    schedule = None
+    if spawns is not None:
+        schedule = {}  # {tick: [(thing class, position tuple)]}
+        for (time, thing_class, position) in spawns:
+            schedule.setdefault(int(time / TICK), []).append((thing_class, position))
+    environment = Environment(size, size, seed)
+    environment.dirt_probability = parameters["dirt_probability"]
+    environment.jewel_probability = parameters["jewel_probability"]
+    agent = VacuumAgent(algorithm=parameters["algorithm"], jewel_penalty=parameters["jewel_penalty"],
+                        verbose=False)
+    environment.add_thing(agent)
+    feed = environment.subscribe()
+    agent(environment.percept())
+
+    sequence, cpu, decisions, cleanliness = [], 0, 0, 0
+    for tick in range(ticks):
+        if schedule is None:
+            environment.spawn()
+        else:
+            for (thing_class, position) in schedule.get(tick, []):
+                if position in environment.free_rooms[thing_class]:  # The room may not have been cleaned
+                    environment.add_thing(thing_class(Position(*position)))
+        if tick % parameters["percept_interval"] == 0:
+            events = feed.take()
+            if any(kind == "spawn" for (version, kind, thing_class, position) in events):
+                start = process_time()
+                sequence = agent(events) or []
+                cpu += process_time() - start
+                decisions += 1
+            elif events:
+                agent.state = agent.update_state(agent.state, events)
+        for _ in range(parameters["actions_per_tick"]):
+            if sequence:
+                environment.execute_action(sequence.pop(0))
+        dirty = sum(1 for thing in environment.things if isinstance(thing, Dirt))
+        cleanliness += 1 - dirty / (size * size)
+
+    return {
+        "cleanliness": cleanliness / ticks,
+        "performance": environment.performance,
+        "cpu_per_decision": cpu / decisions if decisions else 0,
+        "decisions": decisions,
+    }
+
+
+def run_configuration(parameters: Dict, seeds: List[int], ticks: int, size: int, spawns: List[Tuple] = None) -> Dict:
+    """
+    Run a configuration on every seed and average the metrics.
+    :param parameters:
+    :param seeds:
+    :param ticks:
+    :param size:
+    :param spawns: Recorded spawns, the seeds then only change the start of the agent.
+    :return: Parameters and mean metrics.
+    """
+    runs = [simulate(parameters, seed, ticks, size, spawns) for seed in seeds]
+    return dict(parameters, **{metric: mean(run[metric] for run in runs) for metric in METRICS})
+
+
+def grid_search(grid: Dict) -> List[Dict]:
+    return [dict(zip(grid, values)) for values in product(*grid.values())]
+
+
+def random_search(grid: Dict, samples: int, seed: int = 0) -> List[Dict]:
+    """
+    Sample configurations, numeric parameters are drawn between the bounds of their grid values.
+    :param grid:
+    :param samples: Number of configurations.
+    :param seed:
+    :return:
+    """
+    rng = Random(seed)
+    configurations = []
+    for _ in range(samples):
+        parameters = {}
+        for name, values in grid.items():
+            if all(isinstance(v, float) for v in values):
+                parameters[name] = rng.uniform(min(values), max(values))
+            elif all(isinstance(v, int) for v in values):
+                parameters[name] = rng.randint(min(values), max(values))
+            else:
+                parameters[name] = rng.choice(values)
+        configurations.append(parameters)
+    return configurations
+
+
+def sweep(configurations: List[Dict], seeds: List[int], ticks: int = 500, size: int = 5,
+          workers: int = None, spawns: List[Tuple] = None) -> List[Dict]:
+    """
+    Run the configurations in parallel worker processes.
+    :param configurations:
+    :param seeds: Seeds shared by every configuration so they face the same spawns.
+    :param ticks:
+    :param size:
+    :param workers: Number of processes, the number of CPUs if None.
+    :param spawns: Recorded spawns replayed instead of the random ones.
+    :return: Results table, best cleanliness first.
+    """
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(run_configuration, parameters, seeds, ticks, size, spawns)
+                   for parameters in configurations]
+        results = [future.result() for future in futures]
+    return sorted(results, key=lambda result: (-result["cleanliness"], -result["performance"]))
+
+
+def print_table(results: List[Dict]):
+    columns = list(results[0])
+    cells = [[f"{row[c]:.4g}" if isinstance(row[c], float) else str(row[c]) for c in columns] for row in results]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parameter sweep of the vacuum agent.")
+    parser.add_argument("--random", type=int, default=0, help="Number of random configurations, grid search if 0")
+    parser.add_argument("--seeds", type=int, default=4, help="Number of seeded simulations per configuration")
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--size", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--csv", help="Also write the results table to a CSV file")
+    parser.add_argument("--trace", help="Replay the spawns of a recorded run, its grid replaces --size")
+    parser.add_argument("--algorithms", nargs="+", choices=list(ALGORITHMS), default=GRID["algorithm"],
+                        help="Searches compared, e.g. external_astar")
+    args = parser.parse_args()
+
+    spawns = None
+    if args.trace:
+        from recorder import Trace
+        trace = Trace(args.trace)
+        if trace.x_max != trace.y_max:
+            parser.error("the sweep only runs square grids")
+        args.size, spawns = trace.x_max, trace.spawns()
+
+    GRID["algorithm"] = args.algorithms
+    configurations = random_search(GRID, args.random) if args.random else grid_search(GRID)
+    results = sweep(configurations, list(range(args.seeds)), args.ticks, args.size, args.workers, spawns)
+    print_table(results)
+    if args.csv:
+        with open(args.csv, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+from bisect import bisect_left
+from time import monotonic, time, sleep
+from typing import List, Tuple
+
+from problem import Dirt
+
+"""
+------------------------
+-      TELEMETRY       -
+________________________
+
+In-process metrics of the agent, kept in fixed-size structures so the overhead does not grow with the run.
+The performance over time is given by the periodic exports.
+Attach with `environment.telemetry = agent.telemetry = Telemetry()` and `environment.subscribe(telemetry)`.
+"""
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)  # Seconds
+TIME_TO_CLEAN_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300)  # Seconds
+
+
+class RingBuffer:
+    """Keep the last `capacity` values."""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.values = []
+        self.index = 0
+
+    def append(self, value):
+        if len(self.values) < self.capacity:
+            self.values.append(value)
+        else:
+            self.values[self.index] = value
+        self.index = (self.index + 1) % self.capacity
+
+    def __len__(self):
+        return len(self.values)
+
+    def ordered(self) -> List:
+        """Values, oldest first."""
+        if len(self.values) < self.capacity:
+            return list(self.values)
+        return self.values[self.index:] + self.values[:self.index]
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, plus the recent samples for quantiles."""
+
+    def __init__(self, buckets: Tuple, capacity: int = 1024):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0
+        self.recent = RingBuffer(capacity)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantile(self, q: float) -> float:
+        values = sorted(self.recent.values)
+        if not values:
+            return 0
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def to_text(self, name: str) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        cumulated = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulated += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulated}')
+        lines += [f"{name}_sum {self.sum}", f"{name}_count {self.count}"]
+        return lines
+
+    def to_json(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "p50": self.quantile(0.5), "p90": self.quantile(0.9),
+                "p99": self.quantile(0.99)}
+
+
+class Telemetry:
+    """Collect the metrics of the agent and its environment."""
+
+    def __init__(self, capacity: int = 1024):
+        self.lock = threading.Lock()
+        self.replan_latency = Histogram(LATENCY_BUCKETS, capacity)
+        self.time_to_clean = Histogram(TIME_TO_CLEAN_BUCKETS, capacity)
+        self.plan_lengths = RingBuffer(capacity)
+        self.action_times = RingBuffer(capacity)
+        self.actions = 0
+        self.replans = 0
+        self.dirt_spawns = {}  # {position tuple: spawn time}
+        self.performance = 0
+        self.exporter = None
+
+    def __call__(self, event: Tuple):
+        """
+        Change feed subscriber, follows the dirt backlog and the time to clean each dirt.
+        :param event:
+        :return:
+        """
+        (version, kind, thing_class, position) = event
+        if not issubclass(thing_class, Dirt):
+            return
+        with self.lock:
+            if kind == "spawn":
+                self.dirt_spawns[position] = monotonic()
+            elif kind == "delete" and position in self.dirt_spawns:
+                self.time_to_clean.observe(monotonic() - self.dirt_spawns.pop(position))
+
+    def record_replan(self, latency: float, plan_length: int):
+        with self.lock:
+            self.replans += 1
+            self.replan_latency.observe(latency)
+            self.plan_lengths.append(plan_length)
+
+    def record_action(self, performance: int):
+        with self.lock:
+            self.actions += 1
+            self.action_times.append(monotonic())
+            self.performance = performance
+
+    def actions_per_second(self) -> float:
+        times = self.action_times.ordered()
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def to_text(self) -> str:
+        """
+        Metrics in the Prometheus text format.
+        :return:
+        """
+        with self.lock:
+            plan_lengths = self.plan_lengths.ordered()
+            lines = self.replan_latency.to_text("vacuum_replan_latency_seconds")
+            lines += self.time_to_clean.to_text("vacuum_time_to_clean_seconds")
+            lines += [
+                "# TYPE vacuum_replans_total counter", f"vacuum_replans_total {self.replans}",
+                "# TYPE vacuum_plan_length gauge", f"vacuum_plan_length {plan_lengths[-1] if plan_lengths else 0}",
+                "# TYPE vacuum_actions_total counter", f"vacuum_actions_total {self.actions}",
+                "# TYPE vacuum_actions_per_second gauge", f"vacuum_actions_per_second {self.actions_per_second()}",
+                "# TYPE vacuum_dirt_backlog gauge", f"vacuum_dirt_backlog {len(self.dirt_spawns)}",
+                "# TYPE vacuum_performance gauge", f"vacuum_performance {self.performance}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> dict:
+        with self.lock:
+            plan_lengths = self.plan_lengths.ordered()
+            return {
+                "time": time(),
+                "replans": self.replans,
+                "replan_latency": self.replan_latency.to_json(),
+                "plan_length": plan_lengths[-1] if plan_lengths else 0,
+                "actions": self.actions,
+                "actions_per_second": self.actions_per_second(),
+                "dirt_backlog": len(self.dirt_spawns),
+                "time_to_clean": self.time_to_clean.to_json(),
+                "performance": self.performance,
+            }
+
+    def export(self, path: str):
+        """
+        Write the metrics, as a Prometheus text file (replaced atomically) or appended to a JSON lines file (.jsonl).
+        :param path:
+        :return:
+        """
+        if path.endswith(".jsonl"):
+            with open(path, "a") as file:
+                file.write(json.dumps(self.to_json()) + "\n")
+        else:
+            with open(path + ".tmp", "w") as file:
+                file.write(self.to_text())
+            os.replace(path + ".tmp", path)
+
+    def start_exporter(self, path: str, interval: float = 10):
+        """
+        Export the metrics periodically from a daemon thread.
+        :param path: See `export`.
+        :param interval: Seconds between two exports.
+        :return:
+        """
+        def run():
+            while True:
+                sleep(interval)
+                self.export(path)
+
+        self.exporter = threading.Thread(target=run, daemon=True)
+        self.exporter.start()